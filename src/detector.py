@@ -2,11 +2,27 @@
 
 from __future__ import annotations
 
+import hashlib
+import shutil
 from dataclasses import dataclass
-from typing import List, Tuple
+from pathlib import Path
+from typing import List, Sequence, Tuple
 
 import numpy as np
+import torch
 from ultralytics import YOLO
+from ultralytics.utils import DEFAULT_CFG_DICT
+
+try:
+    from ultralytics.utils.nms import non_max_suppression
+except ImportError:  # Ultralytics < 8.4 keeps NMS in ops.
+    from ultralytics.utils.ops import non_max_suppression
+
+from .prefetch import CudaPrefetcher, StagedBatch
+from .preprocess import Preprocessor
+
+DEFAULT_IMGSZ = 640
+EXPORT_CACHE_DIR = Path.home() / ".cache" / "person-detect"
 
 
 @dataclass
@@ -27,14 +43,140 @@ class Detector:
         conf_threshold: float = 0.25,
         imgsz: int | Tuple[int, int] | None = None,
         device: str = "auto",
+        compile: bool = True,
+        torchscript: bool = False,
+        half: bool | None = None,
+        int8: bool = False,
+        int8_data: str | None = None,
+        batch_size: int = 1,
+        prefetch: bool = False,
+        source_hw: Tuple[int, int] | None = None,
     ) -> None:
-        """Load weights and set inference parameters."""
+        """Load weights and set inference parameters.
+
+        Args:
+            half: FP16 inference; None enables it automatically on CUDA devices.
+            int8: Export an INT8 TensorRT engine and run it instead of the weights.
+            int8_data: Dataset yaml used for INT8 calibration.
+            batch_size: Largest batch passed to the model, used for engine export and upload buffers.
+            prefetch: On CUDA, upload batches through pinned buffers on a side stream
+                and run the network on them directly, skipping Ultralytics' predict.
+            source_hw: Frame size (height, width) used to warm up the compiled model;
+                defaults to the inference size.
+        """
+        if torchscript and int8:
+            raise ValueError("Choose either TorchScript or INT8 TensorRT export, not both.")
+        if int8 and not str(device).startswith("cuda"):
+            raise ValueError(f"INT8 TensorRT export requires a CUDA device, got: {device}")
+
         self.model_path = model_path
         self.conf_threshold = conf_threshold
         self.imgsz = imgsz
         self.device = device
+        self.half = str(device).startswith("cuda") if half is None else half
+        self.batch_size = max(1, batch_size)
+        self.source_hw = source_hw
+        self.prefetch = prefetch and str(device).startswith("cuda") and torch.cuda.is_available()
+        self._prefetcher: CudaPrefetcher | None = None
+        self._preprocessor: Preprocessor | None = None
         self.model = YOLO(model_path)
+        # Resolve from the .pt weights: exported models only expose names after a predict call.
         self.person_class_id = self._resolve_person_class_id()
+        self.compiled = False
+        if torchscript:
+            exported = self._export_cached(
+                "torchscript",
+                ".torchscript",
+                tag=str(self.half),
+                optimize=False,
+                **(_precision_kwargs(16) if self.half else {}),
+            )
+            self.model = YOLO(str(exported), task="detect")
+        elif int8:
+            # Ultralytics exports INT8 engines with a dynamic batch capped at `batch`.
+            engine_kwargs = {"batch": self.batch_size, **_precision_kwargs(8)}
+            engine_tag = f"int8-b{self.batch_size}"
+            if int8_data is not None:
+                engine_kwargs["data"] = int8_data
+                # Engines calibrated on different datasets must not share a cache entry.
+                engine_tag += f"-{_short_digest(str(int8_data))}"
+            exported = self._export_cached("engine", ".engine", tag=engine_tag, **engine_kwargs)
+            self.model = YOLO(str(exported), task="detect")
+        if self.prefetch:
+            # Pinned buffers are allocated here so page-locking is paid once, not per batch.
+            dst_hw = self._make_preprocessor(self._warmup_frame().shape[:2]).dst_hw
+            self._prefetcher = CudaPrefetcher(self.batch_size, *dst_hw, device, self.half)
+        if compile and not (torchscript or int8):
+            self.compiled = self._compile_model()
+
+    def _export_cached(self, export_format: str, suffix: str, tag: str, **export_kwargs) -> Path:
+        """Export the weights once per (weights, imgsz, device, tag) and return the cached file."""
+        height, width = self._imgsz_hw()
+        device_tag = str(self.device).replace(":", "-")
+        weights_tag = self._weights_digest()
+        cached = EXPORT_CACHE_DIR / (
+            f"{Path(self.model_path).stem}-{weights_tag}_{height}x{width}_{device_tag}_{tag}{suffix}"
+        )
+        if not cached.exists():
+            exported = self.model.export(
+                format=export_format,
+                imgsz=[height, width],
+                device=self.device,
+                **export_kwargs,
+            )
+            EXPORT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(exported), str(cached))
+        return cached
+
+    def _weights_digest(self) -> str:
+        """Return a short digest of the weights' path, size and mtime.
+
+        Retrained weights saved over the same file (e.g. best.pt), or different
+        files sharing a stem, then get their own cached export.
+        """
+        weights = Path(getattr(self.model, "ckpt_path", None) or self.model_path)
+        identity = str(weights)
+        if weights.exists():
+            stat = weights.stat()
+            identity = f"{weights.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+        return _short_digest(identity)
+
+    def _compile_model(self) -> bool:
+        """Wrap the network with torch.compile, falling back to eager mode on failure."""
+        if not _torch_supports_compile():
+            return False
+
+        # A warmup call makes Ultralytics load, fuse and move the network to the device.
+        frame = self._warmup_frame()
+        self.model.predict(**self._predict_kwargs(frame))
+        backend = self.model.predictor.model
+        eager_model = backend.model
+        try:
+            # dynamic=None recompiles once with a symbolic batch size on the first
+            # size change, so tail batches do not each add a static graph.
+            backend.model = torch.compile(eager_model, mode="reduce-overhead", fullgraph=False, dynamic=None)
+            # Compilation is lazy, so trace now, through the same path and batch sizes
+            # as inference, to surface errors before the video starts.
+            self.detect_batch_arrays([frame] * self.batch_size)
+            if self.batch_size > 1:
+                self.detect_batch_arrays([frame])
+        except Exception as exc:
+            backend.model = eager_model
+            print(f"torch.compile failed, using eager model: {exc}")
+            return False
+        return True
+
+    def _warmup_frame(self) -> np.ndarray:
+        """Return a blank frame of the source size, or of the inference size if unknown."""
+        height, width = self.source_hw if self.source_hw is not None else self._imgsz_hw()
+        return np.zeros((height, width, 3), dtype=np.uint8)
+
+    def _imgsz_hw(self) -> Tuple[int, int]:
+        """Return the inference size as (height, width)."""
+        imgsz = self.imgsz if self.imgsz is not None else DEFAULT_IMGSZ
+        if isinstance(imgsz, int):
+            return imgsz, imgsz
+        return int(imgsz[0]), int(imgsz[1])
 
     def _resolve_person_class_id(self) -> int:
         """Return the numeric class id for 'person'."""
@@ -47,14 +189,158 @@ class Detector:
     def detect(self, frame: np.ndarray) -> List[Detection]:
         """Run inference on a frame and return person detections.
 
+        Slower than detect_arrays because every box becomes a Python object.
+
         Args:
             frame: BGR frame as numpy array.
 
         Returns:
             List of Detection objects filtered to the person class.
         """
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames: Sequence[np.ndarray]) -> List[List[Detection]]:
+        """Run inference on several frames in a single predict call.
+
+        Slower than detect_batch_arrays because every box becomes a Python object.
+
+        Args:
+            frames: BGR frames of the same size.
+
+        Returns:
+            One list of person detections per input frame, in input order.
+        """
+        return [
+            [
+                Detection(bbox=tuple(bbox), confidence=confidence, class_name="person")
+                for bbox, confidence in zip(xyxy.tolist(), conf.tolist())
+            ]
+            for xyxy, conf in self._predict_arrays(frames)
+        ]
+
+    def detect_arrays(self, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Run inference on a frame and return person boxes as arrays.
+
+        Args:
+            frame: BGR frame as numpy array.
+
+        Returns:
+            Pair of int32 xyxy boxes with shape (N, 4) and float32 confidences with shape (N,).
+        """
+        return self.detect_batch_arrays([frame])[0]
+
+    def detect_batch_arrays(self, frames: Sequence[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Run inference on several frames and return per-frame box arrays.
+
+        Args:
+            frames: BGR frames of the same size.
+
+        Returns:
+            One (xyxy int32 (N, 4), conf float32 (N,)) pair per input frame, in input order.
+        """
+        return self.detect_staged_arrays(self.stage_batch(frames))
+
+    def stage_batch(self, frames: Sequence[np.ndarray]) -> StagedBatch | List[np.ndarray]:
+        """Start moving a batch to the device ahead of detect_staged_arrays.
+
+        On CUDA the frames are letterboxed into a pinned buffer and uploaded on a
+        side stream, so staging the next batch (e.g. from a reader thread)
+        overlaps inference of the current one. Elsewhere the frames are returned
+        unchanged and Ultralytics preprocesses them.
+        """
+        if not frames or not self._can_prefetch(frames):
+            return list(frames)
+        return self._prefetcher.stage(frames, self._preprocessor)
+
+    def release_staged(self, staged: StagedBatch | List[np.ndarray]) -> None:
+        """Free the upload buffer of a staged batch that will not be inferred."""
+        if isinstance(staged, StagedBatch):
+            self._prefetcher.release(staged)
+
+    def detect_staged_arrays(self, staged: StagedBatch | List[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Run inference on a batch from stage_batch and return per-frame box arrays.
+
+        Returns:
+            One (xyxy int32 (N, 4), conf float32 (N,)) pair per staged frame, in input order.
+        """
+        return [(xyxy.astype(np.int32), conf) for xyxy, conf in self._predict_arrays(staged)]
+
+    def _can_prefetch(self, frames: Sequence[np.ndarray]) -> bool:
+        """Return True when the batch can go through the pinned upload buffers."""
+        if not self.prefetch or len(frames) > self.batch_size:
+            return False
+        src_hw = frames[0].shape[:2]
+        if self._preprocessor is None or self._preprocessor.src_hw != src_hw:
+            self._preprocessor = self._make_preprocessor(src_hw)
+        return self._prefetcher.fits(len(frames), self._preprocessor.dst_hw)
+
+    def _make_preprocessor(self, src_hw: Tuple[int, int]) -> Preprocessor:
+        """Return a Preprocessor that letterboxes src_hw frames to the shape Ultralytics would use.
+
+        Ultralytics pads only to the next stride multiple (LetterBox(auto=True))
+        when the backend accepts any input size, and to the full imgsz otherwise.
+        """
+        predictor = self._predictor()
+        backend = predictor.model
+        # Ultralytics 8.4 exposes the weights format as backend.format, older releases as flags.
+        backend_format = getattr(backend, "format", None)
+        pytorch = backend_format == "pt" or getattr(backend, "pt", False)
+        imx = backend_format == "imx" or getattr(backend, "imx", False)
+        any_size = pytorch or (getattr(backend, "dynamic", False) and not imx)
+        stride = int(backend.stride) if any_size and getattr(predictor.args, "rect", True) else None
+        return Preprocessor(src_hw, self._imgsz_hw(), stride=stride)
+
+    def _predict_arrays(self, staged: StagedBatch | Sequence[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Predict on a batch and return float32 (xyxy, conf) arrays per frame."""
+        if isinstance(staged, StagedBatch):
+            prefetcher = self._prefetcher
+            try:
+                with torch.cuda.stream(prefetcher.compute_stream):
+                    batch_arrays = self._arrays_from_boxes(self._infer_tensor(prefetcher.tensor(staged)), staged.count)
+            finally:
+                prefetcher.release(staged)
+            # Boxes are in letterboxed coordinates because Ultralytics skips its own preprocessing.
+            return [(staged.preprocessor.scale_boxes(xyxy), conf) for xyxy, conf in batch_arrays]
+
+        frames = staged
+        if not frames:
+            return []
+
+        # Ultralytics treats a stacked (B, H, W, 3) array as one image, so the
+        # batch is passed as a list of frames.
+        results = self.model.predict(**self._predict_kwargs(list(frames)))
+        return self._arrays_from_boxes([result.boxes.data for result in results or []], len(frames))
+
+    def _infer_tensor(self, batch: torch.Tensor) -> List[torch.Tensor]:
+        """Run the network and NMS on a preprocessed batch, returning (N, 6) boxes per frame.
+
+        YOLO.predict would copy a tensor source back to the host to build its
+        Results, so the prefetched batch goes to the Ultralytics backend directly.
+        """
+        predictor = self._predictor()
+        backend = predictor.model
+        # Only newer Ultralytics knows end2end, and only end-to-end heads need it.
+        nms_kwargs = {"end2end": True} if getattr(backend, "end2end", False) else {}
+        return non_max_suppression(
+            backend(batch),
+            self.conf_threshold,
+            predictor.args.iou,
+            classes=[self.person_class_id],
+            max_det=predictor.args.max_det,
+            **nms_kwargs,
+        )
+
+    def _predictor(self):
+        """Return the Ultralytics predictor, running one predict first to set it up."""
+        if self.model.predictor is None:
+            # The first predict call loads the backend and sets the NMS arguments.
+            self.model.predict(**self._predict_kwargs(self._warmup_frame()))
+        return self.model.predictor
+
+    def _predict_kwargs(self, source) -> dict:
+        """Build keyword arguments for YOLO.predict."""
         predict_kwargs = {
-            "source": frame,
+            "source": source,
             "conf": self.conf_threshold,
             "classes": [self.person_class_id],
             "verbose": False,
@@ -62,29 +348,66 @@ class Detector:
         if self.imgsz is not None:
             predict_kwargs["imgsz"] = self.imgsz
         predict_kwargs["device"] = self.device
+        if self.half:
+            predict_kwargs.update(_precision_kwargs(16))
+        return predict_kwargs
 
-        results = self.model.predict(**predict_kwargs)
+    def _arrays_from_boxes(self, boxes: Sequence[torch.Tensor], count: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Filter (N, 6) boxes per frame on the device and copy them to the host in one transfer.
 
-        detections: List[Detection] = []
-        if not results:
-            return detections
+        Each row carries its frame index, so the host array is split back into
+        per-frame (xyxy, conf) arrays with a single np.split.
+        """
+        rows = []
+        for index, frame_boxes in enumerate(boxes):
+            if frame_boxes is None or len(frame_boxes) == 0:
+                continue
+            data = frame_boxes[:, :6]
+            rows.append(torch.cat([data, data.new_full((data.shape[0], 1), index)], dim=1))
+        if not rows:
+            return [_empty_arrays() for _ in range(count)]
 
-        first_result = results[0]
-        boxes = getattr(first_result, "boxes", None)
-        if boxes is None:
-            return detections
+        # Columns: x1, y1, x2, y2, conf, cls, frame index.
+        batch_rows = torch.cat(rows)
+        keep = (batch_rows[:, 4] >= self.conf_threshold) & (batch_rows[:, 5] == self.person_class_id)
+        batch_rows = batch_rows[keep][:, [0, 1, 2, 3, 4, 6]]
+        if batch_rows.is_cuda:
+            host_rows = batch_rows.to("cpu", non_blocking=True)
+            torch.cuda.current_stream(batch_rows.device).synchronize()
+        else:
+            host_rows = batch_rows.cpu()
+        host_rows = host_rows.numpy().astype(np.float32, copy=False)
 
-        for box in boxes:
-            if box.cls is None or box.conf is None or box.xyxy is None:
-                continue
-            coords = box.xyxy[0].tolist()
-            bbox = tuple(float(c) for c in coords)
-            confidence = float(box.conf[0])
-            detections.append(
-                Detection(
-                    bbox=bbox,
-                    confidence=confidence,
-                    class_name="person",
-                )
-            )
-        return detections
+        counts = np.bincount(host_rows[:, 5].astype(np.int64), minlength=count)
+        parts = np.split(host_rows, np.cumsum(counts)[:-1])
+        return [(part[:, :4], part[:, 4]) for part in parts]
+
+
+def _empty_arrays() -> Tuple[np.ndarray, np.ndarray]:
+    """Return empty (xyxy, conf) arrays."""
+    return np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32)
+
+
+def _short_digest(text: str) -> str:
+    """Return an 8-character hex digest of text for cache file names."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:8]
+
+
+def _precision_kwargs(bits: int) -> dict:
+    """Return predict/export kwargs for FP16 (16) or INT8 (8).
+
+    Ultralytics 8.4 replaced the half and int8 flags with quantize and warns on
+    every call that still passes them.
+    """
+    if "quantize" in DEFAULT_CFG_DICT:
+        return {"quantize": bits}
+    return {"half": True} if bits == 16 else {"int8": True}
+
+
+def _torch_supports_compile() -> bool:
+    """Return True when torch.compile is available (torch >= 2.1)."""
+    try:
+        major, minor = (int(part) for part in torch.__version__.split(".")[:2])
+    except ValueError:
+        return False
+    return hasattr(torch, "compile") and (major, minor) >= (2, 1)
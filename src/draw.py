@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Sequence, Tuple
 
 import cv2
@@ -18,7 +19,7 @@ BOX_COLOR = (46, 204, 113)
 TEXT_COLOR = (20, 20, 20)
 
 
-@dataclass
+@dataclass(frozen=True)
 class DrawScale:
     """Scale settings for a single detection."""
 
@@ -28,31 +29,90 @@ class DrawScale:
     padding: int
 
 
-def draw_detections(frame: np.ndarray, detections: Sequence[Detection]) -> np.ndarray:
-    """Draw thin boxes and labels on a frame."""
-    annotated = frame.copy()
+# Small, medium and large size buckets keep label size stable between frames.
+_SCALES = (
+    DrawScale(text_scale=0.40, text_thickness=1, box_thickness=1, padding=2),
+    DrawScale(text_scale=0.55, text_thickness=1, box_thickness=2, padding=4),
+    DrawScale(text_scale=0.75, text_thickness=2, box_thickness=3, padding=6),
+)
+
+
+def draw_boxes(
+    frame: np.ndarray,
+    xyxy: np.ndarray,
+    conf: np.ndarray,
+    *,
+    class_name: str = "person",
+    inplace: bool = True,
+) -> np.ndarray:
+    """Draw thin boxes and labels from int32 (N, 4) boxes and (N,) confidences.
+
+    By default the frame is drawn on in place and the returned array aliases the
+    input; pass inplace=False to draw on a copy instead.
+    """
+    annotated = frame if inplace else frame.copy()
+    for bbox, confidence in zip(xyxy.tolist(), conf.tolist()):
+        _draw_box(annotated, bbox, f"{class_name} {confidence:.2f}", _scales_for_bbox(bbox))
+    return annotated
+
+
+def draw_detections(
+    frame: np.ndarray,
+    detections: Sequence[Detection],
+    *,
+    inplace: bool = True,
+) -> np.ndarray:
+    """Draw thin boxes and labels on a frame.
+
+    Slower than draw_boxes, which avoids per-detection objects. By default the
+    frame is drawn on in place and the returned array aliases the input; pass
+    inplace=False to draw on a copy instead.
+    """
+    annotated = frame if inplace else frame.copy()
     for detection in detections:
-        scale = _scales_for_bbox(detection.bbox)
-        x1, y1, x2, y2 = _as_int_tuple(detection.bbox)
+        label = f"{detection.class_name} {detection.confidence:.2f}"
+        _draw_box(annotated, _as_int_tuple(detection.bbox), label, _scales_for_bbox(detection.bbox))
+    return annotated
+
+
+def _draw_box(canvas: np.ndarray, bbox: Sequence[int], label: str, scale: DrawScale) -> None:
+    """Draw one box outline with its label."""
+    x1, y1, x2, y2 = bbox
+    if scale.box_thickness == 1:
+        _draw_thin_outline(canvas, x1, y1, x2, y2)
+    else:
         cv2.rectangle(
-            annotated,
+            canvas,
             (x1, y1),
             (x2, y2),
             BOX_COLOR,
             scale.box_thickness,
             cv2.LINE_AA,
         )
-        label = f"{detection.class_name} {detection.confidence:.2f}"
-        _draw_label(
-            annotated,
-            x1,
-            y1,
-            label,
-            text_scale=scale.text_scale,
-            text_thickness=scale.text_thickness,
-            padding=scale.padding,
-        )
-    return annotated
+    _draw_label(
+        canvas,
+        x1,
+        y1,
+        label,
+        text_scale=scale.text_scale,
+        text_thickness=scale.text_thickness,
+        padding=scale.padding,
+    )
+
+
+def _draw_thin_outline(canvas: np.ndarray, x1: int, y1: int, x2: int, y2: int) -> None:
+    """Write a 1px outline as four edge spans; axis-aligned 1px lines need no anti-aliasing."""
+    canvas_h, canvas_w = canvas.shape[:2]
+    left, right = max(min(x1, x2), 0), min(max(x1, x2), canvas_w - 1)
+    top, bottom = max(min(y1, y2), 0), min(max(y1, y2), canvas_h - 1)
+    if left > right or top > bottom:
+        return
+    for y in (y1, y2):
+        if 0 <= y < canvas_h:
+            canvas[y, left : right + 1] = BOX_COLOR
+    for x in (x1, x2):
+        if 0 <= x < canvas_w:
+            canvas[top : bottom + 1, x] = BOX_COLOR
 
 
 def _as_int_tuple(bbox: Tuple[float, float, float, float]) -> Tuple[int, int, int, int]:
@@ -70,24 +130,38 @@ def _draw_label(
     padding: int = 4,
 ) -> None:
     """Draw a small filled label and text near the top-left corner."""
+    patch = _label_patch(text, text_scale, text_thickness, padding)
+    y_top = max(y1 - patch.shape[0] + 1, 0)
+    _blit(canvas, patch, x1, y_top)
+
+
+@lru_cache(maxsize=4096)
+def _label_patch(text: str, text_scale: float, text_thickness: int, padding: int) -> np.ndarray:
+    """Render a filled label with its text once; labels repeat across frames."""
     (text_width, text_height), baseline = cv2.getTextSize(text, FONT, text_scale, text_thickness)
-    y_top = max(y1 - text_height - baseline - 2 * padding, 0)
-    x_end = x1 + text_width + 2 * padding
-    y_end = y_top + text_height + baseline + 2 * padding
+    height = text_height + baseline + 2 * padding
+    width = text_width + 2 * padding
+
+    patch = np.empty((height + 1, width + 1, 3), dtype=np.uint8)
+    patch[:] = BOX_COLOR
+    text_org = (padding, height - padding - baseline // 2)
+    cv2.putText(patch, text, text_org, FONT, text_scale, TEXT_COLOR, text_thickness, cv2.LINE_AA)
+    patch.setflags(write=False)
+    return patch
+
 
-    cv2.rectangle(canvas, (x1, y_top), (x_end, y_end), BOX_COLOR, cv2.FILLED, cv2.LINE_AA)
-    text_org = (x1 + padding, y_end - padding - baseline // 2)
-    cv2.putText(canvas, text, text_org, FONT, text_scale, TEXT_COLOR, text_thickness, cv2.LINE_AA)
+def _blit(canvas: np.ndarray, patch: np.ndarray, x: int, y: int) -> None:
+    """Copy patch onto canvas with its top-left corner at (x, y), clipped to the canvas."""
+    canvas_h, canvas_w = canvas.shape[:2]
+    x_start, y_start = max(x, 0), max(y, 0)
+    x_stop = min(x + patch.shape[1], canvas_w)
+    y_stop = min(y + patch.shape[0], canvas_h)
+    if x_start >= x_stop or y_start >= y_stop:
+        return
+    canvas[y_start:y_stop, x_start:x_stop] = patch[y_start - y : y_stop - y, x_start - x : x_stop - x]
 
 
-def _scales_for_bbox(bbox: Tuple[float, float, float, float]) -> DrawScale:
+def _scales_for_bbox(bbox: Sequence[float]) -> DrawScale:
     """Scale thickness and text size using size buckets to avoid jitter per frame."""
-    w = max(1.0, bbox[2] - bbox[0])
-    h = max(1.0, bbox[3] - bbox[1])
-    ref = min(w, h)
-
-    if ref < 60:
-        return DrawScale(text_scale=0.40, text_thickness=1, box_thickness=1, padding=2)
-    if ref < 150:
-        return DrawScale(text_scale=0.55, text_thickness=1, box_thickness=2, padding=4)
-    return DrawScale(text_scale=0.75, text_thickness=2, box_thickness=3, padding=6)
+    ref = min(max(1.0, bbox[2] - bbox[0]), max(1.0, bbox[3] - bbox[1]))
+    return _SCALES[0 if ref < 60 else 1 if ref < 150 else 2]
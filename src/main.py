@@ -6,18 +6,37 @@ import argparse
 import csv
 import json
 import math
+import os
+import queue
+import textwrap
+import threading
 import time
 from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Optional, Sequence, Tuple
 
+import cv2
+import numpy as np
 import torch
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is used when it is missing.
+    orjson = None
+
 from .detector import Detector
-from .draw import draw_detections
-from .video_io import create_video_writer, open_video_capture
+from .draw import draw_boxes
+from .video_io import (
+    VIDEO_BACKENDS,
+    VideoReader,
+    VideoSaver,
+    create_video_writer,
+    open_video_capture,
+)
 
 VIDEO_EXTENSIONS = {".mp4", ".mov", ".avi", ".mkv"}
+DEFAULT_BATCH_SIZE = 16
+HALF_MODES = {"auto": None, "on": True, "off": False}
 
 
 @dataclass
@@ -44,6 +63,17 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--conf", type=float, default=0.25)
     parser.add_argument("--imgsz", type=int, default=None)
     parser.add_argument("--device", default="auto")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--compile", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--torchscript", action="store_true")
+    parser.add_argument("--half", choices=sorted(HALF_MODES), default="auto")
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--int8-data", default=None)
+    parser.add_argument("--video-backend", choices=VIDEO_BACKENDS, default="auto")
+    parser.add_argument("--prefetch", action=argparse.BooleanOptionalAction, default=False)
+    throttle = parser.add_mutually_exclusive_group()
+    throttle.add_argument("--every-n", type=int, default=1)
+    throttle.add_argument("--target-fps", type=float, default=None)
     return parser.parse_args()
 
 
@@ -54,9 +84,28 @@ def process_video(
     conf: float,
     imgsz: Optional[int | Tuple[int, int]] = None,
     device: str = "auto",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    compile: bool = True,
+    torchscript: bool = False,
+    half: bool | None = None,
+    int8: bool = False,
+    int8_data: str | None = None,
+    video_backend: str = "auto",
+    every_n: int = 1,
+    target_fps: Optional[float] = None,
+    prefetch: bool = False,
+    detectors: Optional[Dict[Tuple[object, ...], Detector]] = None,
 ) -> VideoMetrics:
-    """Run detection on a video and save annotated frames."""
-    capture, metadata = open_video_capture(input_path)
+    """Run detection on a video and save annotated frames.
+
+    Args:
+        detectors: Optional cache of detectors keyed by the inference size, device and
+            every model option. When given, the detector of the previous video is
+            reused if the key matches, instead of reloading (and recompiling) the
+            model. Only the latest detector is kept, since each holds its model and
+            upload buffers.
+    """
+    capture, metadata = open_video_capture(input_path, backend=video_backend)
     effective_imgsz: int | Tuple[int, int] | None
     if imgsz is None:
         # Default to the input video size to avoid resizing.
@@ -68,26 +117,92 @@ def process_video(
         effective_imgsz = _adjust_imgsz_to_stride(effective_imgsz)
 
     effective_device = _normalize_device(device)
-    detector = Detector(model_path=model_path, conf_threshold=conf, imgsz=effective_imgsz, device=effective_device)
-    writer = create_video_writer(output_path, metadata)
+    batch_size = max(1, batch_size)
+    detector_key = (
+        model_path,
+        conf,
+        effective_imgsz,
+        effective_device,
+        batch_size,
+        compile,
+        torchscript,
+        half,
+        int8,
+        int8_data,
+        prefetch,
+    )
+    try:
+        detector = detectors.get(detector_key) if detectors is not None else None
+        if detector is None:
+            detector = Detector(
+                model_path=model_path,
+                conf_threshold=conf,
+                imgsz=effective_imgsz,
+                device=effective_device,
+                compile=compile,
+                torchscript=torchscript,
+                half=half,
+                int8=int8,
+                int8_data=int8_data,
+                batch_size=batch_size,
+                prefetch=prefetch,
+                source_hw=(metadata.height, metadata.width),
+            )
+            if detectors is not None:
+                detectors.clear()
+                detectors[detector_key] = detector
+        # video_backend is left unresolved so "auto" can fall back to the OpenCV writer.
+        writer = create_video_writer(output_path, metadata, backend=video_backend)
+    except BaseException:
+        capture.release()
+        raise
+
+    # Decode + preprocessing and encode run in their own threads so they overlap inference.
+    step = _inference_step(every_n, target_fps, metadata.fps)
+    batches_in: queue.Queue = queue.Queue(maxsize=2)
+    frames_out: queue.Queue = queue.Queue(maxsize=2 * batch_size)
+    stop = threading.Event()
+    errors: list[BaseException] = []
+    reader = threading.Thread(
+        target=_read_batches,
+        args=(capture, detector, batch_size, step, batches_in, stop, errors),
+        daemon=True,
+    )
+    writer_thread = threading.Thread(
+        target=_write_frames,
+        args=(writer, frames_out, metadata.frame_count, errors),
+        daemon=True,
+    )
 
+    last_boxes = (np.empty((0, 4), dtype=np.int32), np.empty((0,), dtype=np.float32))
     frame_index = 0
     total_detections = 0
     start = time.perf_counter()
+    reader.start()
+    writer_thread.start()
     try:
-        while True:
-            ret, frame = capture.read()
-            if not ret:
+        while not errors:
+            batch = batches_in.get()
+            if batch is None:
                 break
-            detections = detector.detect(frame)
-            total_detections += len(detections)
-            annotated = draw_detections(frame, detections)
-            writer.write(annotated)
-            frame_index += 1
-            _print_progress(frame_index, metadata.frame_count)
+            frames, first_index, staged = batch
+            detections, last_boxes = _annotate_batch(
+                detector, frames, first_index, staged, step, last_boxes, frames_out
+            )
+            total_detections += detections
+            frame_index += len(frames)
     finally:
+        stop.set()
+        # Draining unblocks the reader; drain again after join for a batch it queued meanwhile.
+        _discard_batches(batches_in, detector)
+        frames_out.put(None)
+        reader.join()
+        _discard_batches(batches_in, detector)
+        writer_thread.join()
         capture.release()
         writer.release()
+    if errors:
+        raise errors[0]
     duration = time.perf_counter() - start
     processing_fps = frame_index / duration if duration > 0 else 0.0
     avg_det = total_detections / frame_index if frame_index else 0.0
@@ -111,6 +226,124 @@ def process_video(
     )
 
 
+def _annotate_batch(
+    detector: Detector,
+    frames: Sequence[np.ndarray],
+    first_index: int,
+    staged: object,
+    step: int,
+    last_boxes: Tuple[np.ndarray, np.ndarray],
+    frames_out: queue.Queue,
+) -> Tuple[int, Tuple[np.ndarray, np.ndarray]]:
+    """Detect people on every step-th frame, queue annotated frames.
+
+    Skipped frames are drawn with the boxes of the latest inferred frame.
+
+    Args:
+        staged: Result of detector.stage_batch for the step-th frames of this chunk.
+
+    Returns:
+        Number of drawn detections and the boxes of the last inferred frame.
+    """
+    inferred = iter(detector.detect_staged_arrays(staged))
+    total = 0
+    for index, frame in enumerate(frames, first_index):
+        if index % step == 0:
+            last_boxes = next(inferred)
+        xyxy, conf = last_boxes
+        total += len(conf)
+        frames_out.put(draw_boxes(frame, xyxy, conf))
+    return total, last_boxes
+
+
+def _read_batches(
+    capture: VideoReader,
+    detector: Detector,
+    batch_size: int,
+    step: int,
+    batches_in: queue.Queue,
+    stop: threading.Event,
+    errors: list[BaseException],
+) -> None:
+    """Reader thread: decode frames, group them into batches and stage them for inference.
+
+    Each queued item is (frames, index of the first frame, staged step-th frames).
+    A batch closes once it holds batch_size decoded frames, so memory stays
+    bounded when only every step-th frame is inferred; a None sentinel marks
+    the end of the video.
+    """
+    frames: list[np.ndarray] = []
+    to_infer: list[np.ndarray] = []
+    first_index = 0
+    try:
+        while not stop.is_set():
+            ret, frame = capture.read()
+            if ret:
+                if (first_index + len(frames)) % step == 0:
+                    to_infer.append(frame)
+                frames.append(frame)
+            # Stage a full batch, or the tail batch once the video is exhausted.
+            if frames and (not ret or len(frames) == batch_size):
+                staged = detector.stage_batch(to_infer)
+                if not _put_unless_stopped(batches_in, (frames, first_index, staged), stop):
+                    detector.release_staged(staged)
+                first_index += len(frames)
+                frames = []
+                to_infer = []
+            if not ret:
+                break
+    except BaseException as exc:
+        errors.append(exc)
+    finally:
+        _put_unless_stopped(batches_in, None, stop)
+
+
+def _discard_batches(batches_in: queue.Queue, detector: Detector) -> None:
+    """Drop batches left in the queue and free their upload buffers."""
+    while True:
+        try:
+            batch = batches_in.get_nowait()
+        except queue.Empty:
+            return
+        if batch is not None:
+            detector.release_staged(batch[2])
+
+
+def _write_frames(
+    writer: VideoSaver,
+    frames_out: queue.Queue,
+    total_frames: int,
+    errors: list[BaseException],
+) -> None:
+    """Writer thread: encode frames from frames_out in order until a None sentinel."""
+    written = 0
+    while True:
+        frame = frames_out.get()
+        if frame is None:
+            return
+        if errors:
+            # Keep draining so the inference loop never blocks on a full queue.
+            continue
+        try:
+            writer.write(frame)
+        except BaseException as exc:
+            errors.append(exc)
+            continue
+        written += 1
+        _print_progress(written, total_frames)
+
+
+def _put_unless_stopped(target: queue.Queue, item: object, stop: threading.Event) -> bool:
+    """Put item into a bounded queue, giving up once stop is set; return True if it was put."""
+    while True:
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            if stop.is_set():
+                return False
+
+
 def process_directory(
     input_dir: Path,
     output_dir: Path,
@@ -118,8 +351,24 @@ def process_directory(
     conf: float,
     imgsz: Optional[int | Tuple[int, int]] = None,
     device: str = "auto",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    compile: bool = True,
+    torchscript: bool = False,
+    half: bool | None = None,
+    int8: bool = False,
+    int8_data: str | None = None,
+    video_backend: str = "auto",
+    every_n: int = 1,
+    target_fps: Optional[float] = None,
+    prefetch: bool = False,
 ) -> list[VideoMetrics]:
-    """Process every video file in input_dir and save results to output_dir."""
+    """Process every video file in input_dir and save results to output_dir.
+
+    Without imgsz, videos are processed grouped by resolution (by name within a
+    group) so each resolution loads and compiles the model once. Metrics are
+    appended to metrics.json and metrics.csv in output_dir as each video
+    finishes, so a crash mid-run keeps the rows written so far.
+    """
     videos = _list_videos(input_dir)
     if not videos:
         raise FileNotFoundError(
@@ -128,18 +377,35 @@ def process_directory(
 
     output_dir.mkdir(parents=True, exist_ok=True)
     collected: list[VideoMetrics] = []
-    for video_path in videos:
-        target_path = output_dir / video_path.name
-        print(f"\nProcessing {video_path} -> {target_path}")
-        metrics = process_video(
-            input_path=video_path,
-            output_path=target_path,
-            model_path=model_path,
-            conf=conf,
-            imgsz=imgsz,
-            device=device,
-        )
-        collected.append(metrics)
+    if imgsz is None:
+        # The inference size follows each video's resolution, so keep same-size videos together.
+        videos = sorted(videos, key=lambda path: _video_size(path, video_backend))
+    detectors: Dict[Tuple[object, ...], Detector] = {}
+    with MetricsWriter(output_dir) as metrics_writer:
+        for video_path in videos:
+            target_path = output_dir / video_path.name
+            print(f"\nProcessing {video_path} -> {target_path}")
+            metrics = process_video(
+                input_path=video_path,
+                output_path=target_path,
+                model_path=model_path,
+                conf=conf,
+                imgsz=imgsz,
+                device=device,
+                batch_size=batch_size,
+                compile=compile,
+                torchscript=torchscript,
+                half=half,
+                int8=int8,
+                int8_data=int8_data,
+                video_backend=video_backend,
+                every_n=every_n,
+                target_fps=target_fps,
+                prefetch=prefetch,
+                detectors=detectors,
+            )
+            metrics_writer.write(metrics)
+            collected.append(metrics)
     return collected
 
 
@@ -151,6 +417,17 @@ def _list_videos(directory: Path) -> list[Path]:
     )
 
 
+def _video_size(path: Path, backend: str) -> Tuple[int, int]:
+    """Return (height, width) of a video, or (0, 0) if it cannot be opened."""
+    try:
+        capture, metadata = open_video_capture(path, backend=backend)
+    except ValueError:
+        # process_video reports the error when the video's turn comes.
+        return 0, 0
+    capture.release()
+    return metadata.height, metadata.width
+
+
 def _print_progress(current: int, total: int) -> None:
     """Print a simple progress bar to the console."""
     if total <= 0:
@@ -164,6 +441,13 @@ def _print_progress(current: int, total: int) -> None:
     print(f"[{bar}] {percent:5.1f}% ({current}/{total})", end="\r")
 
 
+def _inference_step(every_n: int, target_fps: Optional[float], source_fps: float) -> int:
+    """Return how often to run inference: every n-th frame, or enough to reach target_fps."""
+    if target_fps is not None and target_fps > 0 and source_fps > 0:
+        return max(1, math.ceil(source_fps / target_fps))
+    return max(1, every_n)
+
+
 def _adjust_imgsz_to_stride(imgsz: int | Tuple[int, int], stride: int = 32) -> int | Tuple[int, int]:
     """Snap imgsz to a stride multiple to avoid YOLO warnings."""
     if isinstance(imgsz, int):
@@ -175,36 +459,74 @@ def _adjust_imgsz_to_stride(imgsz: int | Tuple[int, int], stride: int = 32) -> i
     )
 
 
+class MetricsWriter:
+    """Stream per-video metrics to metrics.json and metrics.csv in output_dir."""
+
+    def __init__(self, output_dir: Path) -> None:
+        """Open both files; the JSON array is closed by close()."""
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self._json_file = (output_dir / "metrics.json").open("w", encoding="utf-8")
+        self._csv_file = (output_dir / "metrics.csv").open("w", newline="", encoding="utf-8")
+        self._csv_writer: Optional[csv.DictWriter] = None
+        self._count = 0
+        self._json_file.write("[")
+
+    def write(self, metrics: VideoMetrics) -> None:
+        """Append one video's metrics and flush.
+
+        JSON keeps floats at full precision; CSV formats them with 2 decimals.
+        """
+        row = asdict(metrics)
+        if self._csv_writer is None:
+            self._csv_writer = csv.DictWriter(self._csv_file, fieldnames=list(row))
+            self._csv_writer.writeheader()
+        self._csv_writer.writerow(
+            {key: f"{value:.2f}" if isinstance(value, float) else value for key, value in row.items()}
+        )
+
+        record = _dumps_json(row)
+        separator = ",\n" if self._count else "\n"
+        self._json_file.write(separator + textwrap.indent(record, "  "))
+        self._count += 1
+        self._json_file.flush()
+        self._csv_file.flush()
+
+    def close(self) -> None:
+        """Close the JSON array and both files."""
+        self._json_file.write("\n]" if self._count else "]")
+        self._json_file.close()
+        self._csv_file.close()
+
+    def __enter__(self) -> "MetricsWriter":
+        """Return the writer for use in a with block."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the files, keeping rows already written."""
+        self.close()
+
+
+def _dumps_json(data: object) -> str:
+    """Serialize data as JSON indented by 2 spaces, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
 def write_metrics_files(metrics: list[VideoMetrics], output_dir: Path) -> None:
     """Save metrics to JSON and CSV in output_dir."""
-    output_dir.mkdir(parents=True, exist_ok=True)
-    json_path = output_dir / "metrics.json"
-    csv_path = output_dir / "metrics.csv"
-
-    data = _round_float_fields([asdict(m) for m in metrics], ndigits=2)
-    with json_path.open("w", encoding="utf-8") as jf:
-        json.dump(data, jf, ensure_ascii=False, indent=2)
-
-    if data:
-        headers = list(data[0].keys())
-        with csv_path.open("w", newline="", encoding="utf-8") as cf:
-            writer = csv.DictWriter(cf, fieldnames=headers)
-            writer.writeheader()
-            writer.writerows(data)
-
-
-def _round_float_fields(data: list[dict], ndigits: int) -> list[dict]:
-    """Round float values in metrics dictionaries."""
-    rounded: list[dict] = []
-    for item in data:
-        new_item = {}
-        for key, value in item.items():
-            if isinstance(value, float):
-                new_item[key] = round(value, ndigits)
-            else:
-                new_item[key] = value
-        rounded.append(new_item)
-    return rounded
+    with MetricsWriter(output_dir) as metrics_writer:
+        for item in metrics:
+            metrics_writer.write(item)
+
+
+def _configure_threads() -> None:
+    """Keep OpenCV and PyTorch thread pools from oversubscribing the CPU."""
+    cv2.setUseOptimized(True)
+    # The OpenCV pool is process-wide; decode, draw and encode already run on their own threads.
+    cv2.setNumThreads(1)
+    if "OMP_NUM_THREADS" not in os.environ:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // 2))
 
 
 def _normalize_device(device: str) -> str:
@@ -221,20 +543,30 @@ def _normalize_device(device: str) -> str:
 def main() -> None:
     """Entry point when running from a terminal."""
     args = parse_args()
+    _configure_threads()
     input_path = Path("assets")
     output_path = Path("outputs")
 
     if input_path.is_dir():
         output_dir = output_path if output_path.suffix == "" else output_path.parent
-        metrics = process_directory(
+        process_directory(
             input_dir=input_path,
             output_dir=output_dir,
             model_path=args.model,
             conf=args.conf,
             imgsz=args.imgsz,
             device=args.device,
+            batch_size=args.batch_size,
+            compile=args.compile,
+            torchscript=args.torchscript,
+            half=HALF_MODES[args.half],
+            int8=args.int8,
+            int8_data=args.int8_data,
+            video_backend=args.video_backend,
+            every_n=args.every_n,
+            target_fps=args.target_fps,
+            prefetch=args.prefetch,
         )
-        write_metrics_files(metrics, output_dir)
     else:
         final_output = output_path
         if output_path.is_dir() or output_path.suffix == "":
@@ -249,6 +581,16 @@ def main() -> None:
             conf=args.conf,
             imgsz=args.imgsz,
             device=args.device,
+            batch_size=args.batch_size,
+            compile=args.compile,
+            torchscript=args.torchscript,
+            half=HALF_MODES[args.half],
+            int8=args.int8,
+            int8_data=args.int8_data,
+            video_backend=args.video_backend,
+            every_n=args.every_n,
+            target_fps=args.target_fps,
+            prefetch=args.prefetch,
         )
         write_metrics_files([metrics], final_output.parent)
 
@@ -0,0 +1,115 @@
+"""Pinned-memory staging of frame batches for overlapped CUDA uploads."""
+
+from __future__ import annotations
+
+import queue
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from .preprocess import Preprocessor
+
+
+@dataclass
+class StagedBatch:
+    """Batch whose host-to-device copy has been queued on the copy stream."""
+
+    slot: int
+    count: int
+    uploaded: torch.cuda.Event
+    preprocessor: Preprocessor
+
+
+PINNED_BUFFERS = 3
+
+
+class CudaPrefetcher:
+    """Upload frame batches through a pool of pinned buffers on a side CUDA stream.
+
+    Frames are letterboxed into a pinned uint8 (B, H, W, 3) host buffer, copied to
+    the device with a non-blocking copy on copy_stream, and turned into a
+    normalized RGB (B, 3, H, W) tensor on compute_stream. Inference for one batch
+    can then run while the next batch is being uploaded. stage may run on another
+    thread than tensor; it blocks until a buffer has been released.
+
+    The host buffers stay uint8 rather than float16: that is already half the
+    bytes of an FP16 batch, and the conversion runs on the device.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        height: int,
+        width: int,
+        device: str,
+        half: bool,
+        buffers: int = PINNED_BUFFERS,
+    ) -> None:
+        """Allocate pinned host buffers and matching device buffers once, up front.
+
+        Buffers are flat and sized for batch_size frames of height x width;
+        each batch uses a contiguous view of its own letterboxed size.
+        """
+        self.device = torch.device(device)
+        self.dtype = torch.float16 if half else torch.float32
+        self.copy_stream = torch.cuda.Stream(device=self.device)
+        self.compute_stream = torch.cuda.Stream(device=self.device)
+        self.capacity = batch_size * height * width * 3
+        self._host = [torch.empty(self.capacity, dtype=torch.uint8, pin_memory=True) for _ in range(buffers)]
+        self._device_buffers = [
+            torch.empty(self.capacity, dtype=torch.uint8, device=self.device) for _ in range(buffers)
+        ]
+        self._copied: List[Optional[torch.cuda.Event]] = [None] * buffers
+        self._consumed: List[Optional[torch.cuda.Event]] = [None] * buffers
+        self._free: queue.Queue = queue.Queue()
+        for slot in range(buffers):
+            self._free.put(slot)
+
+    def fits(self, count: int, hw: Tuple[int, int]) -> bool:
+        """Return True when count frames of size hw fit in one buffer."""
+        return count * hw[0] * hw[1] * 3 <= self.capacity
+
+    def stage(self, frames: Sequence[np.ndarray], preprocessor: Preprocessor) -> StagedBatch:
+        """Letterbox frames into a free pinned buffer and queue their upload."""
+        slot = self._free.get()
+        if self._copied[slot] is not None:
+            # The previous upload from this host buffer must finish before it is overwritten.
+            self._copied[slot].synchronize()
+
+        count = len(frames)
+        host = _batch_view(self._host[slot], count, preprocessor.dst_hw)
+        host_view = host.numpy()
+        for index, frame in enumerate(frames):
+            preprocessor(frame, host_view[index])
+
+        uploaded = torch.cuda.Event()
+        with torch.cuda.stream(self.copy_stream):
+            if self._consumed[slot] is not None:
+                self.copy_stream.wait_event(self._consumed[slot])
+            _batch_view(self._device_buffers[slot], count, preprocessor.dst_hw).copy_(host, non_blocking=True)
+            uploaded.record(self.copy_stream)
+        self._copied[slot] = uploaded
+        return StagedBatch(slot=slot, count=count, uploaded=uploaded, preprocessor=preprocessor)
+
+    def release(self, staged: StagedBatch) -> None:
+        """Hand back the buffer of a staged batch once its results are in or it is dropped."""
+        self._free.put(staged.slot)
+
+    def tensor(self, staged: StagedBatch) -> torch.Tensor:
+        """Return the staged batch as a normalized RGB (B, 3, H, W) tensor on compute_stream."""
+        self.compute_stream.wait_event(staged.uploaded)
+        with torch.cuda.stream(self.compute_stream):
+            frames = _batch_view(self._device_buffers[staged.slot], staged.count, staged.preprocessor.dst_hw)
+            tensor = frames.flip(-1).permute(0, 3, 1, 2).to(self.dtype).div_(255.0).contiguous()
+            consumed = torch.cuda.Event()
+            consumed.record(self.compute_stream)
+        self._consumed[staged.slot] = consumed
+        return tensor
+
+
+def _batch_view(buffer: torch.Tensor, count: int, hw: Tuple[int, int]) -> torch.Tensor:
+    """View the start of a flat uint8 buffer as a contiguous (count, H, W, 3) batch."""
+    height, width = hw
+    return buffer[: count * height * width * 3].view(count, height, width, 3)
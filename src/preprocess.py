@@ -0,0 +1,66 @@
+"""Letterbox preprocessing with the resize geometry computed once per video."""
+
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+PAD_VALUE = 114
+
+
+class Preprocessor:
+    """Letterbox frames of one size into an inference size, as Ultralytics does.
+
+    The scale ratio and padding depend only on the source and destination sizes,
+    so they are computed once and reused for every frame and for mapping boxes
+    back to source coordinates.
+    """
+
+    def __init__(self, src_hw: Tuple[int, int], dst_hw: Tuple[int, int], stride: Optional[int] = None) -> None:
+        """Precompute the resize ratio, unpadded size and padding offsets.
+
+        With a stride, frames are padded only up to the next stride multiple
+        instead of to the full dst_hw, like Ultralytics' LetterBox(auto=True);
+        self.dst_hw is then the smaller padded size.
+        """
+        src_h, src_w = src_hw
+        dst_h, dst_w = dst_hw
+        self.src_hw = (int(src_h), int(src_w))
+        self.ratio = min(dst_h / src_h, dst_w / src_w)
+        new_w = int(round(src_w * self.ratio))
+        new_h = int(round(src_h * self.ratio))
+        self.new_unpad = (new_w, new_h)
+        pad_w, pad_h = dst_w - new_w, dst_h - new_h
+        if stride is not None:
+            pad_w, pad_h = pad_w % stride, pad_h % stride
+        self.dst_hw = (new_h + pad_h, new_w + pad_w)
+        dw = pad_w / 2
+        dh = pad_h / 2
+        self.left = int(round(dw - 0.1))
+        self.top = int(round(dh - 0.1))
+
+    def __call__(self, frame: np.ndarray, out: np.ndarray) -> None:
+        """Write the letterboxed frame into out, a (dst_h, dst_w, 3) uint8 array."""
+        new_w, new_h = self.new_unpad
+        top, left = self.top, self.left
+        bottom, right = top + new_h, left + new_w
+        region = out[top:bottom, left:right]
+        if frame.shape[0] == new_h and frame.shape[1] == new_w:
+            region[...] = frame
+        else:
+            cv2.resize(frame, self.new_unpad, dst=region, interpolation=cv2.INTER_LINEAR)
+        # Border fill in place of cv2.copyMakeBorder, which would allocate a new image.
+        out[:top] = PAD_VALUE
+        out[bottom:] = PAD_VALUE
+        out[top:bottom, :left] = PAD_VALUE
+        out[top:bottom, right:] = PAD_VALUE
+
+    def scale_boxes(self, xyxy: np.ndarray) -> np.ndarray:
+        """Map (N, 4) xyxy boxes from letterboxed to source coordinates."""
+        src_h, src_w = self.src_hw
+        boxes = (xyxy - np.array([self.left, self.top, self.left, self.top], dtype=xyxy.dtype)) / self.ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, src_w)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, src_h)
+        return boxes.astype(xyxy.dtype, copy=False)
@@ -3,10 +3,21 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from fractions import Fraction
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple, Union
 
 import cv2
+import numpy as np
+import torch
+
+try:
+    import av
+except ImportError:  # PyAV is optional; OpenCV is used when it is missing.
+    av = None
+
+VIDEO_BACKENDS = ("auto", "opencv", "pyav")
+PYAV_ENCODERS = ("h264_nvenc", "libx264")
 
 
 @dataclass
@@ -24,11 +35,117 @@ class VideoMetadata:
         return self.width, self.height
 
 
-def open_video_capture(path: str | Path) -> tuple[cv2.VideoCapture, VideoMetadata]:
+class PyAVCapture:
+    """VideoCapture-like reader that decodes with PyAV, on NVDEC when available."""
+
+    def __init__(self, path: Path, hwaccel: bool = True) -> None:
+        """Open the container and its first video stream."""
+        accel = _cuda_hwaccel() if hwaccel else None
+        self._container = av.open(str(path), hwaccel=accel) if accel is not None else av.open(str(path))
+        self.stream = self._container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        self._frames = self._container.decode(self.stream)
+        self._current = None
+
+    def isOpened(self) -> bool:
+        """Return True while the container is open."""
+        return self._container is not None
+
+    def grab(self) -> bool:
+        """Decode the next frame without converting it to BGR."""
+        self._current = next(self._frames, None)
+        return self._current is not None
+
+    def retrieve(self) -> tuple[bool, Optional[np.ndarray]]:
+        """Return the last grabbed frame as a BGR array."""
+        if self._current is None:
+            return False, None
+        return True, self._current.to_ndarray(format="bgr24")
+
+    def read(self) -> tuple[bool, Optional[np.ndarray]]:
+        """Decode and return the next frame as a BGR array."""
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self) -> None:
+        """Close the container."""
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+
+class PyAVWriter:
+    """VideoWriter-like encoder backed by PyAV, on NVENC when available."""
+
+    def __init__(self, path: Path, metadata: VideoMetadata) -> None:
+        """Open the output container with the first encoder that initializes."""
+        fps = metadata.fps if metadata.fps > 0 else 30.0
+        rate = Fraction(fps).limit_denominator(1001)
+        last_error: Optional[Exception] = None
+        for codec in PYAV_ENCODERS:
+            container = av.open(str(path), mode="w")
+            stream = container.add_stream(codec, rate=rate)
+            stream.width = metadata.width
+            stream.height = metadata.height
+            stream.pix_fmt = "yuv420p"
+            try:
+                # Open eagerly so a missing GPU falls back here rather than on the first frame.
+                stream.codec_context.open()
+            except av.FFmpegError as exc:
+                container.close()
+                last_error = exc
+                continue
+            self._container = container
+            self._stream = stream
+            return
+        raise ValueError(f"Failed to open any of {PYAV_ENCODERS} for: {path}") from last_error
+
+    def isOpened(self) -> bool:
+        """Return True while the container is open."""
+        return self._container is not None
+
+    def write(self, frame: np.ndarray) -> None:
+        """Encode a BGR frame."""
+        video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+        for packet in self._stream.encode(video_frame):
+            self._container.mux(packet)
+
+    def release(self) -> None:
+        """Flush the encoder and close the container."""
+        if self._container is None:
+            return
+        for packet in self._stream.encode():
+            self._container.mux(packet)
+        self._container.close()
+        self._container = None
+
+
+VideoReader = Union[cv2.VideoCapture, PyAVCapture]
+VideoSaver = Union[cv2.VideoWriter, PyAVWriter]
+
+
+def resolve_video_backend(backend: str = "auto") -> str:
+    """Pick a concrete video backend name.
+
+    Raises:
+        ValueError: If the backend is unknown or PyAV is requested but missing.
+    """
+    if backend not in VIDEO_BACKENDS:
+        raise ValueError(f"Unknown video backend: {backend}. Choose from {VIDEO_BACKENDS}")
+    if backend == "pyav" and av is None:
+        raise ValueError("The 'pyav' video backend requires the 'av' package.")
+    if backend == "auto":
+        return "pyav" if av is not None and torch.cuda.is_available() else "opencv"
+    return backend
+
+
+def open_video_capture(path: str | Path, backend: str = "auto") -> tuple[VideoReader, VideoMetadata]:
     """Open a video file and gather metadata.
 
     Args:
         path: Path to the input video.
+        backend: "opencv", "pyav" or "auto" (PyAV when installed and CUDA is available).
 
     Returns:
         Pair of open VideoCapture and its metadata.
@@ -41,6 +158,9 @@ def open_video_capture(path: str | Path) -> tuple[cv2.VideoCapture, VideoMetadat
     if not video_path.exists():
         raise FileNotFoundError(f"Input video not found: {video_path}")
 
+    if resolve_video_backend(backend) == "pyav":
+        return _open_pyav_capture(video_path)
+
     capture = cv2.VideoCapture(str(video_path))
     if not capture.isOpened():
         raise ValueError(f"Failed to open video: {video_path}")
@@ -58,12 +178,18 @@ def open_video_capture(path: str | Path) -> tuple[cv2.VideoCapture, VideoMetadat
     return capture, metadata
 
 
-def create_video_writer(output_path: str | Path, metadata: VideoMetadata) -> cv2.VideoWriter:
+def create_video_writer(
+    output_path: str | Path,
+    metadata: VideoMetadata,
+    backend: str = "auto",
+) -> VideoSaver:
     """Create a VideoWriter for saving annotated frames.
 
     Args:
         output_path: Path to the output video file.
         metadata: Metadata of the input video.
+        backend: "opencv", "pyav" or "auto" (PyAV when installed and CUDA is available,
+            falling back to OpenCV when no PyAV encoder opens).
 
     Returns:
         Configured and opened VideoWriter.
@@ -74,6 +200,15 @@ def create_video_writer(output_path: str | Path, metadata: VideoMetadata) -> cv2
     output = Path(output_path)
     output.parent.mkdir(parents=True, exist_ok=True)
 
+    if resolve_video_backend(backend) == "pyav":
+        try:
+            return PyAVWriter(output, metadata)
+        except ValueError as exc:
+            if backend != "auto":
+                raise
+            # e.g. odd frame sizes, which yuv420p encoders reject.
+            print(f"PyAV encoders unavailable, using OpenCV writer: {exc}")
+
     fourcc = cv2.VideoWriter_fourcc(*"mp4v")
     fps = metadata.fps if metadata.fps > 0 else 30.0
     writer = cv2.VideoWriter(str(output), fourcc, fps, metadata.size)
@@ -82,3 +217,41 @@ def create_video_writer(output_path: str | Path, metadata: VideoMetadata) -> cv2
         raise ValueError(f"Failed to create VideoWriter for: {output}")
 
     return writer
+
+
+def _open_pyav_capture(video_path: Path) -> tuple[PyAVCapture, VideoMetadata]:
+    """Open a video with PyAV and read metadata from its first video stream."""
+    try:
+        capture = PyAVCapture(video_path)
+    except av.FFmpegError:
+        # e.g. torch sees CUDA but FFmpeg cannot create a CUDA device; decode on the CPU.
+        try:
+            capture = PyAVCapture(video_path, hwaccel=False)
+        except (av.FFmpegError, IndexError) as exc:
+            raise ValueError(f"Failed to open video: {video_path}") from exc
+    except IndexError as exc:
+        raise ValueError(f"Failed to open video: {video_path}") from exc
+
+    codec_context = capture.stream.codec_context
+    width = int(codec_context.width or 0)
+    height = int(codec_context.height or 0)
+    fps = float(capture.stream.average_rate or 0.0)
+    frame_count = int(capture.stream.frames or 0)
+
+    if width <= 0 or height <= 0:
+        capture.release()
+        raise ValueError(f"Invalid video dimensions for: {video_path}")
+
+    metadata = VideoMetadata(width=width, height=height, fps=fps, frame_count=frame_count)
+    return capture, metadata
+
+
+def _cuda_hwaccel():
+    """Return a CUDA HWAccel for PyAV decoding, or None when unsupported."""
+    try:
+        from av.codec.hwaccel import HWAccel, hwdevices_available
+    except ImportError:  # PyAV < 14 has no hardware decoding API.
+        return None
+    if "cuda" not in hwdevices_available() or not torch.cuda.is_available():
+        return None
+    return HWAccel(device_type="cuda", allow_software_fallback=True)